@@ -29,15 +29,15 @@ __license__ = "MIT"
 
 import os
 import re
-import time
 import tkinter as tk
 import tkinter.filedialog
 import tkinter.messagebox
+import tkinter.simpledialog
 from contextlib import contextmanager
 from queue import Queue, Empty
-from threading import Thread
 from tkinter import ttk
 
+from app.source import SourceManager, FileSource, SourceEndedError, parseSource, COMMAND_SOURCE_PREFIX
 from app.util import optionMenu, button, label, scrolledText, checkButton, entry, findAll
 
 SEARCH_TAG = "Search"
@@ -111,13 +111,14 @@ class Application(ttk.Frame):
         self.lCurrentSearchResult = None
         self.oFilterRegexVar = None
         self.oFilterEntryVar = None
-        self.bWatchFile = False
-        self.oFileWatchThread = None
-        self.oQueue = Queue()
+        # The queue is bounded so that the sources are throttled when the display cannot keep up
+        self.oQueue = Queue(maxsize=1000)
+        self.oSourceManager = SourceManager(self.oQueue)
+        self.oCurrentSource = None
         self.bProcessQueue = True
         self.oPauseResumeButton = None
 
-        self.lRecentSourceFiles = []
+        self.lRecentSources = []
         self.lLogLevels = [
             LogLevel("Error", re.compile(r"^.*\sERROR\s"), "red"),
             LogLevel("Warning", re.compile(r"^.*\sWARN\s"), "orange"),
@@ -150,11 +151,15 @@ class Application(ttk.Frame):
         oSourceArea.grid(row=0, column=0, columnspan=2, sticky=tk.N + tk.E + tk.W + tk.S, ipady=5)
 
         label(oSourceArea, "Source: ").pack(side=tk.LEFT, padx=5)
-        self.oSourceOptionMenu = optionMenu(oSourceArea, self.lRecentSourceFiles,
-                                            xCallback=lambda s: self.openNewSourceFile(s))
+        self.oSourceOptionMenu = optionMenu(oSourceArea, self.lRecentSources,
+                                            xCallback=lambda s: self.openNewSource(s))
         self.oSourceOptionMenu.pack(side=tk.LEFT, fill=tk.X, expand=True)
         button(oSourceArea, "Choose...", xCallback=lambda: self.onChooseSourceButtonClicked()) \
             .pack(side=tk.LEFT, padx=5)
+        button(oSourceArea, "Command...", xCallback=lambda: self.onCommandSourceButtonClicked()) \
+            .pack(side=tk.LEFT)
+        button(oSourceArea, "Other...", xCallback=lambda: self.onOtherSourceButtonClicked()) \
+            .pack(side=tk.LEFT, padx=5)
 
         oFilterArea = ttk.Frame(self, relief=tk.RAISED, borderwidth=1)
         oFilterArea.grid(row=1, column=0, columnspan=2, sticky=tk.N + tk.E + tk.W + tk.S, ipady=5)
@@ -193,7 +198,7 @@ class Application(ttk.Frame):
         self.oPauseResumeButton = button(oLeftButtonsArea, "Pause", xCallback=lambda: self.onPauseResumeButtonClicked())
         self.oPauseResumeButton.pack(side=tk.TOP, pady=(5, 0))
         button(oLeftButtonsArea, "Clear", xCallback=lambda: self.clearLog()).pack(side=tk.TOP)
-        button(oLeftButtonsArea, "Reload", xCallback=lambda: self.startFileWatch(self.lRecentSourceFiles[0])) \
+        button(oLeftButtonsArea, "Reload", xCallback=lambda: self.reloadSource()) \
             .pack(side=tk.TOP)
         button(oLeftButtonsArea, "Go to bottom", xCallback=lambda: self.scrollToBottom()).pack(side=tk.TOP)
 
@@ -220,7 +225,7 @@ class Application(ttk.Frame):
             self.oHorizontalScrollbar.config(command=self.oLogTextArea.xview)
 
     def onClose(self):
-        self.stopFileWatch()
+        self.oSourceManager.stop()
         self.oMaster.destroy()
 
     def onControlF(self):
@@ -231,7 +236,18 @@ class Application(ttk.Frame):
     def onChooseSourceButtonClicked(self):
         sNewSourceFilePath = tk.filedialog.askopenfilename()
         if sNewSourceFilePath:
-            self.openNewSourceFile(sNewSourceFilePath)
+            self.openNewSource(sNewSourceFilePath)
+
+    def onCommandSourceButtonClicked(self):
+        sCommand = tk.simpledialog.askstring("Command", "Command to run (e.g. journalctl -f):", parent=self)
+        if sCommand and sCommand.strip():
+            self.openNewSource(COMMAND_SOURCE_PREFIX + sCommand.strip())
+
+    def onOtherSourceButtonClicked(self):
+        sSpec = tk.simpledialog.askstring("Source", "Source (file:<path>, cmd:<command>, tcp:[<host>:]<port> or "
+                                                    "unix:<path>):", parent=self)
+        if sSpec and sSpec.strip():
+            self.openNewSource(sSpec.strip())
 
     def onPauseResumeButtonClicked(self):
         self.bProcessQueue = not self.bProcessQueue
@@ -286,48 +302,70 @@ class Application(ttk.Frame):
                         self.appendLogLines(lLines)
                         for _ in range(iTasks):
                             self.oQueue.task_done()
+            self.reportSourceErrors()
             self.master.after(500, doProcess)
 
         self.master.after(500, doProcess)
 
-    def openNewSourceFile(self, sFilePath):
-        sFilePath = os.path.normcase(os.path.abspath(sFilePath))
-        if not os.path.isfile(sFilePath):
-            tk.messagebox.showwarning("File not found", "File not found:\n%s" % sFilePath)
+    def reportSourceErrors(self):
+        try:
+            while True:
+                oSource, oError = self.oSourceManager.oErrorQueue.get(False)
+                if isinstance(oError, SourceEndedError):
+                    tk.messagebox.showinfo("Source ended", "Source ended:\n%s\n\n%s" % (oSource, oError))
+                else:
+                    tk.messagebox.showwarning("Source error", "Error while reading source:\n%s\n\n%s"
+                                              % (oSource, oError))
+        except Empty:
+            pass
+
+    def openNewSource(self, sSpec):
+        try:
+            oSource = parseSource(sSpec)
+        except ValueError as e:
+            tk.messagebox.showwarning("Invalid source", "Invalid source:\n%s\n\n%s" % (sSpec, e))
+            return
+
+        if isinstance(oSource, FileSource):
+            sSpec = os.path.normcase(os.path.abspath(oSource.sFilePath))
+            if not os.path.isfile(sSpec):
+                tk.messagebox.showwarning("File not found", "File not found:\n%s" % sSpec)
+                return
+            oSource = FileSource(sSpec)
+
+        if not self.startSource(oSource):
             return
 
-        if sFilePath in self.lRecentSourceFiles:
-            self.lRecentSourceFiles.remove(sFilePath)
-        self.lRecentSourceFiles.insert(0, sFilePath)
-        self.oSourceOptionMenu.updateChoices(self.lRecentSourceFiles)
+        if sSpec in self.lRecentSources:
+            self.lRecentSources.remove(sSpec)
+        self.lRecentSources.insert(0, sSpec)
+        self.oSourceOptionMenu.updateChoices(self.lRecentSources)
 
-        self.startFileWatch(sFilePath)
+    def reloadSource(self):
+        if self.lRecentSources:
+            self.startSource(parseSource(self.lRecentSources[0]))
 
-    def startFileWatch(self, sFilePath):
-        self.stopFileWatch()
+    def startSource(self, oSource):
+        # The current source is kept if the new one cannot be opened, unless both are the same and cannot coexist
+        # (e.g. listening on the same port)
+        if self.oCurrentSource is not None and str(self.oCurrentSource) == str(oSource):
+            self.stopSource()
+        try:
+            self.oSourceManager.addSource(oSource, bStart=False)
+        except Exception as e:
+            tk.messagebox.showwarning("Cannot open source", "Cannot open source:\n%s\n\n%s" % (oSource, e))
+            return False
+        self.stopSource()
         self.clearLog()
         self.oQueue.queue.clear()
-        self.oFileWatchThread = Thread(target=lambda: self.fileWatch(sFilePath))
-        self.oFileWatchThread.start()
-
-    def fileWatch(self, sFilePath):
-        self.bWatchFile = True
-        print("File watch started")
-        try:
-            with open(sFilePath, "r", encoding="utf-8") as oFile:
-                while self.bWatchFile:
-                    sContent = oFile.read()
-                    if sContent:
-                        self.oQueue.put(sContent)
-                    else:
-                        time.sleep(0.5)
-        finally:
-            print("File watch terminated")
-
-    def stopFileWatch(self):
-        if self.oFileWatchThread:
-            self.bWatchFile = False
-            self.oFileWatchThread.join()
+        self.oCurrentSource = oSource
+        self.oSourceManager.startSource(oSource)
+        return True
+
+    def stopSource(self):
+        if self.oCurrentSource:
+            self.oSourceManager.removeSource(self.oCurrentSource)
+            self.oCurrentSource = None
 
     def clearLog(self):
         self.lExpressions = []
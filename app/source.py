@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Quoc-Nam Dessoulles
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Asynchronous log sources."""
+
+__author__ = "Quoc-Nam Dessoulles"
+__email__ = "cokie.forever@gmail.com"
+__license__ = "MIT"
+
+import abc
+import asyncio
+import codecs
+import concurrent.futures
+import os
+import shlex
+import subprocess
+import sys
+import time
+from queue import Queue, Full
+from threading import Thread
+
+if sys.platform == "win32":
+    # Creates overlapped pipes, which are required to read them with the proactor event loop
+    from asyncio.windows_utils import Popen
+else:
+    from subprocess import Popen
+
+FILE_SOURCE_PREFIX = "file:"
+COMMAND_SOURCE_PREFIX = "cmd:"
+TCP_SOURCE_PREFIX = "tcp:"
+UNIX_SOURCE_PREFIX = "unix:"
+
+
+class SourceEndedError(Exception):
+    pass
+
+
+class LineDecoder:
+    """Decodes a byte stream into text, only returning complete lines."""
+
+    def __init__(self, sEncoding="utf-8"):
+        self.oDecoder = codecs.getincrementaldecoder(sEncoding)(errors="replace")
+        self.sPendingText = ""
+
+    def decode(self, yData, bFinal=False):
+        self.sPendingText += self.oDecoder.decode(yData, final=bFinal)
+        # The last line may be incomplete, it is kept for the next chunk unless this is the end of the stream
+        iEndIdx = len(self.sPendingText) if bFinal else self.sPendingText.rfind("\n") + 1
+        sContent, self.sPendingText = self.sPendingText[:iEndIdx], self.sPendingText[iEndIdx:]
+        return sContent
+
+
+class LogSource(abc.ABC):
+    """Base class of the log sources.
+
+    A source is run by a SourceManager on its event loop. It is first opened, so that e.g. a missing file or a port
+    already in use is reported right away, then it reads raw bytes and forwards complete lines to the ingest queue until
+    it is closed. When the queue is full the source stops reading until there is room again, so that the producer (pipe,
+    socket) is throttled instead of the memory filling up.
+    """
+
+    iChunkSize = 64 * 1024
+    fQueueFullDelay = 0.05
+
+    def __init__(self, sSpec, sEncoding="utf-8"):
+        self.sSpec = sSpec
+        self.sEncoding = sEncoding
+
+    def __str__(self):
+        return self.sSpec
+
+    async def open(self):
+        pass
+
+    @abc.abstractmethod
+    async def read(self, oQueue):
+        pass
+
+    async def close(self):
+        pass
+
+    async def readStream(self, oReader, oQueue):
+        oLineDecoder = LineDecoder(self.sEncoding)
+        while True:
+            yData = await oReader.read(self.iChunkSize)
+            await self.put(oLineDecoder.decode(yData, bFinal=not yData), oQueue)
+            if not yData:
+                return
+
+    async def put(self, sContent, oQueue):
+        while sContent:
+            try:
+                oQueue.put_nowait(sContent)
+                return
+            except Full:
+                await asyncio.sleep(self.fQueueFullDelay)
+
+
+class FileSource(LogSource):
+    """Follows a file, like `tail -f`.
+
+    Regular files cannot be awaited on, so the end of the file is polled and the blocking reads are done in the
+    default executor of the loop. This way a slow file (e.g. on a network share) does not stall the other sources.
+    """
+
+    fPollInterval = 0.2
+
+    def __init__(self, sFilePath, sEncoding="utf-8"):
+        super().__init__(sFilePath, sEncoding=sEncoding)
+        self.sFilePath = sFilePath
+        self.oFile = None
+
+    async def open(self):
+        oFuture = asyncio.get_event_loop().run_in_executor(None, open, self.sFilePath, "rb")
+        try:
+            self.oFile = await asyncio.shield(oFuture)
+        except asyncio.CancelledError:
+            # The file is still being opened by the executor, it must be closed when it is
+            oFuture.add_done_callback(closeOpenedFile)
+            raise
+
+    async def read(self, oQueue):
+        oLoop = asyncio.get_event_loop()
+        # A followed file never ends, so an incomplete last line is kept until its end is written
+        oLineDecoder = LineDecoder(self.sEncoding)
+        while True:
+            yData = await oLoop.run_in_executor(None, self.oFile.read, self.iChunkSize)
+            if yData:
+                await self.put(oLineDecoder.decode(yData), oQueue)
+            else:
+                await asyncio.sleep(self.fPollInterval)
+
+    async def close(self):
+        if self.oFile is not None:
+            self.oFile.close()
+            self.oFile = None
+
+
+class CommandSource(LogSource):
+    """Reads the standard output of a command, e.g. `journalctl -f` or `kubectl logs -f`.
+
+    The process is started with Popen and its output pipe attached to the loop, rather than with
+    asyncio.create_subprocess_exec(), which does not work on a loop running outside of the main thread before
+    Python 3.8.
+    """
+
+    fWaitInterval = 0.05
+    fTerminateTimeout = 2
+
+    def __init__(self, sCommand, sEncoding="utf-8"):
+        super().__init__(COMMAND_SOURCE_PREFIX + sCommand, sEncoding=sEncoding)
+        if not sCommand.strip():
+            raise ValueError("No command given")
+        # Windows programs parse their command line themselves, so it is passed as is
+        self.oArgs = sCommand if os.name == "nt" else shlex.split(sCommand)
+        self.oProcess = None
+        self.oReader = None
+        self.oTransport = None
+
+    async def open(self):
+        self.oProcess = Popen(self.oArgs, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              bufsize=0)
+        self.oReader = asyncio.StreamReader()
+        self.oTransport, _ = await asyncio.get_event_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self.oReader), self.oProcess.stdout)
+
+    async def read(self, oQueue):
+        await self.readStream(self.oReader, oQueue)
+        await self.waitProcess()
+        # Commands are expected to be followed, so their end is reported like an error
+        if self.oProcess.returncode:
+            raise SourceEndedError("The command exited with code %d" % self.oProcess.returncode)
+        raise SourceEndedError("The command has ended")
+
+    async def waitProcess(self, fTimeout=None):
+        fEndTime = None if fTimeout is None else time.monotonic() + fTimeout
+        while self.oProcess.poll() is None:
+            if fEndTime is not None and time.monotonic() > fEndTime:
+                return False
+            await asyncio.sleep(self.fWaitInterval)
+        return True
+
+    async def close(self):
+        if self.oTransport is not None:
+            self.oTransport.close()
+            self.oTransport = None
+        if self.oProcess is not None:
+            if self.oProcess.poll() is None:
+                self.oProcess.terminate()
+                if not await self.waitProcess(self.fTerminateTimeout):
+                    self.oProcess.kill()
+                    await self.waitProcess()
+            self.oProcess = None
+
+
+class SocketSource(LogSource):
+    """Listens on a TCP or Unix stream socket, e.g. for a syslog forwarder.
+
+    Several clients may be connected at the same time. Lines are forwarded as they come, the content of each connection
+    being buffered separately so that lines from different clients are not mixed up.
+    """
+
+    def __init__(self, sSpec, sHost=None, iPort=None, sPath=None, sEncoding="utf-8"):
+        super().__init__(sSpec, sEncoding=sEncoding)
+        self.sHost = sHost
+        self.iPort = iPort
+        self.sPath = sPath
+        self.oServer = None
+        self.oClientsQueue = None
+        self.lClientTasks = []
+
+    async def open(self):
+        self.oClientsQueue = asyncio.Queue()
+        if self.sPath is not None:
+            self.oServer = await asyncio.start_unix_server(self.onClientConnected, path=self.sPath)
+        else:
+            self.oServer = await asyncio.start_server(self.onClientConnected, host=self.sHost, port=self.iPort)
+
+    async def onClientConnected(self, oReader, oWriter):
+        # The clients are only read once the source is running, where the ingest queue is known
+        await self.oClientsQueue.put((oReader, oWriter))
+
+    async def read(self, oQueue):
+        while True:
+            oReader, oWriter = await self.oClientsQueue.get()
+            oTask = asyncio.ensure_future(self.readClient(oReader, oWriter, oQueue))
+            self.lClientTasks.append(oTask)
+            oTask.add_done_callback(self.lClientTasks.remove)
+
+    async def readClient(self, oReader, oWriter, oQueue):
+        try:
+            await self.readStream(oReader, oQueue)
+        finally:
+            oWriter.close()
+
+    async def close(self):
+        if self.oServer is not None:
+            self.oServer.close()
+            for oTask in list(self.lClientTasks):
+                oTask.cancel()
+            await asyncio.gather(*self.lClientTasks, return_exceptions=True)
+            while not self.oClientsQueue.empty():
+                self.oClientsQueue.get_nowait()[1].close()
+            await self.oServer.wait_closed()
+            self.oServer = None
+            if self.sPath is not None and os.path.exists(self.sPath):
+                os.remove(self.sPath)
+
+
+class SourceManager:
+    """Runs the log sources on a single asyncio event loop, in a single background thread.
+
+    Errors raised by a running source are put in the error queue, to be reported by the thread owning the manager.
+    Adding or removing a source blocks the calling thread, but never longer than the timeout. A source can be added
+    without being started, in which case it is opened but nothing is read until startSource() is called.
+    """
+
+    fTimeout = 5
+
+    def __init__(self, oQueue):
+        self.oQueue = oQueue
+        self.oErrorQueue = Queue()
+        self.oLoop = None
+        self.oThread = None
+        self.dTasks = {}
+        self.dStartEvents = {}
+
+    def start(self):
+        if self.oThread is not None:
+            return
+        # Subprocess pipes can only be read with the proactor event loop on Windows, which is not the default before 3.8
+        self.oLoop = asyncio.ProactorEventLoop() if sys.platform == "win32" else asyncio.new_event_loop()
+        self.oThread = Thread(target=self.runLoop, daemon=True)
+        self.oThread.start()
+
+    def runLoop(self):
+        asyncio.set_event_loop(self.oLoop)
+        try:
+            self.oLoop.run_forever()
+        finally:
+            self.oLoop.close()
+
+    def stop(self):
+        if self.oThread is None:
+            return
+        self.removeAllSources()
+        self.oLoop.call_soon_threadsafe(self.oLoop.stop)
+        self.oThread.join()
+        self.oThread = None
+        self.oLoop = None
+
+    def addSource(self, oSource, bStart=True):
+        self.start()
+        # Errors raised while opening the source are raised here
+        oFuture = asyncio.run_coroutine_threadsafe(self.openSource(oSource), self.oLoop)
+        try:
+            self.dTasks[oSource], self.dStartEvents[oSource] = oFuture.result(self.fTimeout)
+        except concurrent.futures.TimeoutError:
+            oFuture.cancel()
+            raise TimeoutError("The source could not be opened within %g s" % self.fTimeout)
+        if bStart:
+            self.startSource(oSource)
+        return oSource
+
+    def startSource(self, oSource):
+        oStartEvent = self.dStartEvents.pop(oSource, None)
+        if oStartEvent is not None:
+            self.oLoop.call_soon_threadsafe(oStartEvent.set)
+
+    async def openSource(self, oSource):
+        try:
+            await oSource.open()
+        except BaseException:
+            await oSource.close()
+            raise
+        oStartEvent = asyncio.Event()
+        oTask = asyncio.ensure_future(self.runSource(oSource, oStartEvent))
+        try:
+            # Lets the task start, so that the source is closed even if the task is cancelled right away
+            await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            # The caller gave up, nobody else knows about the task
+            oTask.cancel()
+            raise
+        return oTask, oStartEvent
+
+    async def runSource(self, oSource, oStartEvent):
+        print("Source started: %s" % oSource)
+        try:
+            await oStartEvent.wait()
+            await oSource.read(self.oQueue)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.oErrorQueue.put((oSource, e))
+        finally:
+            await oSource.close()
+            print("Source terminated: %s" % oSource)
+
+    def removeSource(self, oSource):
+        self.dStartEvents.pop(oSource, None)
+        oTask = self.dTasks.pop(oSource, None)
+        if oTask is not None:
+            # Waiting for the termination guarantees that nothing will be added to the queue afterwards
+            try:
+                asyncio.run_coroutine_threadsafe(self.cancelTask(oTask), self.oLoop).result(self.fTimeout)
+            except concurrent.futures.TimeoutError:
+                self.oErrorQueue.put((oSource, TimeoutError("The source could not be stopped within %g s"
+                                                            % self.fTimeout)))
+
+    async def cancelTask(self, oTask):
+        oTask.cancel()
+        await asyncio.gather(oTask, return_exceptions=True)
+
+    def removeAllSources(self):
+        for oSource in list(self.dTasks):
+            self.removeSource(oSource)
+
+
+def closeOpenedFile(oFuture):
+    if not oFuture.cancelled() and oFuture.exception() is None:
+        oFuture.result().close()
+
+
+def parseSource(sSpec):
+    if sSpec.startswith(COMMAND_SOURCE_PREFIX):
+        return CommandSource(sSpec[len(COMMAND_SOURCE_PREFIX):].strip())
+    if sSpec.startswith(UNIX_SOURCE_PREFIX):
+        return SocketSource(sSpec, sPath=sSpec[len(UNIX_SOURCE_PREFIX):].strip())
+    if sSpec.startswith(TCP_SOURCE_PREFIX):
+        sHost, _, sPort = sSpec[len(TCP_SOURCE_PREFIX):].strip().rpartition(":")
+        if sHost.startswith("[") and sHost.endswith("]"):
+            sHost = sHost[1:-1]
+        iPort = int(sPort)
+        if not 0 < iPort < 65536:
+            raise ValueError("Invalid port: %d" % iPort)
+        # Only local clients are accepted by default, the port should not be reachable from the network
+        return SocketSource(sSpec, sHost=sHost or "localhost", iPort=iPort)
+    if sSpec.startswith(FILE_SOURCE_PREFIX):
+        sSpec = sSpec[len(FILE_SOURCE_PREFIX):].strip()
+    return FileSource(sSpec)
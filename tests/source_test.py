@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2020 Quoc-Nam Dessoulles
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""Tests of the log sources."""
+
+__author__ = "Quoc-Nam Dessoulles"
+__email__ = "cokie.forever@gmail.com"
+__license__ = "MIT"
+
+import asyncio
+import os
+import socket
+import sys
+import time
+from queue import Queue, Empty
+
+import pytest
+
+from app.source import LogSource, LineDecoder, SourceManager, SourceEndedError, FileSource, CommandSource, \
+    SocketSource, parseSource
+
+
+def readQueue(oQueue, sExpected, fTimeout=5):
+    sContent = ""
+    fEndTime = time.time() + fTimeout
+    while sContent != sExpected and time.time() < fEndTime:
+        try:
+            sContent += oQueue.get(timeout=0.1)
+        except Empty:
+            pass
+    return sContent
+
+
+def test_lineDecoder():
+    oLineDecoder = LineDecoder()
+    assert oLineDecoder.decode(b"first\nsec") == "first\n"
+    assert oLineDecoder.decode(b"ond \xc3") == ""
+    assert oLineDecoder.decode(b"\xa9t\xc3\xa9\n") == "second été\n"
+    assert oLineDecoder.decode(b"last", bFinal=True) == "last"
+
+
+def test_parseSource():
+    assert isinstance(parseSource("/var/log/app.log"), FileSource)
+    assert parseSource("file:/var/log/app.log").sFilePath == "/var/log/app.log"
+    assert parseSource("cmd:journalctl -f").oArgs == (["journalctl", "-f"] if os.name != "nt" else "journalctl -f")
+    oSource = parseSource("tcp:localhost:5140")
+    assert (oSource.sHost, oSource.iPort) == ("localhost", 5140)
+    assert parseSource("tcp:5140").sHost == "localhost"
+    assert parseSource("tcp:[::1]:5140").sHost == "::1"
+    assert parseSource("unix:/tmp/log.sock").sPath == "/tmp/log.sock"
+    with pytest.raises(ValueError):
+        parseSource("tcp:localhost:port")
+    with pytest.raises(ValueError):
+        parseSource("tcp:99999")
+    with pytest.raises(ValueError):
+        parseSource("cmd: ")
+
+
+def test_fileSource(tmp_path):
+    oFilePath = tmp_path / "test.log"
+    oFilePath.write_text("line 1\nline 2\n")
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSource = oSourceManager.addSource(FileSource(str(oFilePath)))
+        assert readQueue(oQueue, "line 1\nline 2\n") == "line 1\nline 2\n"
+        with open(str(oFilePath), "a") as oFile:
+            oFile.write("line 3\n")
+        assert readQueue(oQueue, "line 3\n") == "line 3\n"
+        with open(str(oFilePath), "ab") as oFile:
+            oFile.write("line é".encode()[:-1])
+        assert readQueue(oQueue, "", fTimeout=0.5) == ""
+        with open(str(oFilePath), "ab") as oFile:
+            oFile.write("line é\n".encode()[-2:])
+        assert readQueue(oQueue, "line é\n") == "line é\n"
+        oSourceManager.removeSource(oSource)
+        with open(str(oFilePath), "a") as oFile:
+            oFile.write("line 4\n")
+        assert readQueue(oQueue, "", fTimeout=0.5) == ""
+    finally:
+        oSourceManager.stop()
+
+
+def test_fileSourceBackpressure(tmp_path):
+    oFilePath = tmp_path / "test.log"
+    oFilePath.write_text("line\n" * 1000)
+    oQueue = Queue(maxsize=1)
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSource = FileSource(str(oFilePath))
+        oSource.iChunkSize = 1000
+        oSourceManager.addSource(oSource)
+        time.sleep(0.2)
+        assert oQueue.qsize() == 1
+        assert readQueue(oQueue, "line\n" * 1000) == "line\n" * 1000
+    finally:
+        oSourceManager.stop()
+
+
+def test_commandSource():
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSourceManager.addSource(CommandSource('"%s" -c "print(\'hello\'); print(\'world\')"' % sys.executable))
+        assert readQueue(oQueue, "hello\nworld\n") == "hello\nworld\n"
+        oSource, oError = oSourceManager.oErrorQueue.get(timeout=5)
+        assert isinstance(oError, SourceEndedError)
+        assert str(oError) == "The command has ended"
+        oSourceManager.addSource(CommandSource('"%s" -c "import sys; sys.exit(3)"' % sys.executable))
+        oSource, oError = oSourceManager.oErrorQueue.get(timeout=5)
+        assert str(oError) == "The command exited with code 3"
+        with pytest.raises(OSError):
+            oSourceManager.addSource(CommandSource("missing-executable-for-test"))
+    finally:
+        oSourceManager.stop()
+
+
+def test_commandSourceIgnoringTermination():
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSource = CommandSource('"%s" -c "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); '
+                                'print(\'hi\', flush=True); time.sleep(30)"' % sys.executable)
+        oSource.fTerminateTimeout = 0.5
+        oSourceManager.addSource(oSource)
+        assert readQueue(oQueue, "hi\n") == "hi\n"
+        oProcess = oSource.oProcess
+        fStartTime = time.time()
+        oSourceManager.removeSource(oSource)
+        assert time.time() - fStartTime < 3
+        assert oProcess.poll() is not None
+    finally:
+        oSourceManager.stop()
+
+
+def test_socketSource():
+    with socket.socket() as oSocket:
+        oSocket.bind(("127.0.0.1", 0))
+        iPort = oSocket.getsockname()[1]
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSourceManager.addSource(SocketSource("tcp:127.0.0.1:%d" % iPort, sHost="127.0.0.1", iPort=iPort))
+        fEndTime = time.time() + 5
+        while True:
+            try:
+                oClient = socket.create_connection(("127.0.0.1", iPort))
+                break
+            except ConnectionRefusedError:
+                if time.time() > fEndTime:
+                    raise
+                time.sleep(0.05)
+        with oClient:
+            oClient.sendall(b"line 1\nline")
+            assert readQueue(oQueue, "line 1\n") == "line 1\n"
+            oClient.sendall(b" 2\n")
+            assert readQueue(oQueue, "line 2\n") == "line 2\n"
+    finally:
+        oSourceManager.stop()
+
+
+def test_sourceErrors(tmp_path):
+    class FailingSource(LogSource):
+        async def read(self, oQueue):
+            raise IOError("Read error")
+
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        with pytest.raises(FileNotFoundError):
+            oSourceManager.addSource(FileSource(str(tmp_path / "missing.log")))
+        with socket.socket() as oSocket:
+            oSocket.bind(("127.0.0.1", 0))
+            oSocket.listen()
+            with pytest.raises(OSError):
+                oSourceManager.addSource(SocketSource("tcp", sHost="127.0.0.1", iPort=oSocket.getsockname()[1]))
+        oSource = oSourceManager.addSource(FailingSource("failing"))
+        oFailedSource, oError = oSourceManager.oErrorQueue.get(timeout=5)
+        assert oFailedSource is oSource
+        assert str(oError) == "Read error"
+    finally:
+        oSourceManager.stop()
+
+
+def test_sourceStartedLater(tmp_path):
+    oFilePath = tmp_path / "test.log"
+    oFilePath.write_text("line 1\n")
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    try:
+        oSource = oSourceManager.addSource(FileSource(str(oFilePath)), bStart=False)
+        assert readQueue(oQueue, "", fTimeout=0.5) == ""
+        oSourceManager.startSource(oSource)
+        assert readQueue(oQueue, "line 1\n") == "line 1\n"
+    finally:
+        oSourceManager.stop()
+
+
+def test_sourceOpenTimeout():
+    class SlowSource(LogSource):
+        bClosed = False
+
+        async def open(self):
+            await asyncio.sleep(5)
+
+        async def read(self, oQueue):
+            pass
+
+        async def close(self):
+            self.bClosed = True
+
+    oQueue = Queue()
+    oSourceManager = SourceManager(oQueue)
+    oSourceManager.fTimeout = 0.2
+    try:
+        oSource = SlowSource("slow")
+        with pytest.raises(TimeoutError, match="within 0.2 s"):
+            oSourceManager.addSource(oSource)
+        fEndTime = time.time() + 5
+        while not oSource.bClosed and time.time() < fEndTime:
+            time.sleep(0.05)
+        assert oSource.bClosed
+        assert not oSourceManager.dTasks
+    finally:
+        oSourceManager.stop()